@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+OnlyFans Downloader - Archive Output
+Streams downloaded files into rolling tar/zip volumes instead of loose files
+"""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set
+
+
+ARCHIVE_FORMATS = ('tar', 'zip')
+
+# Members bigger than this are spooled to a temp file instead of memory
+SPOOL_MAX_MEMORY = 64 * 1024 * 1024
+
+# Bytes written when a volume is finished: tar end-of-archive blocks, or the zip
+# end of central directory record plus its zip64 variant and locator
+TAR_END_SIZE = 2 * tarfile.BLOCKSIZE
+ZIP_END_SIZE = 22 + 56 + 20
+
+
+class ArchiveWriter:
+    """Writes members into numbered volumes (<prefix>_0001.tar, ...) capped at volume_size bytes.
+
+    <prefix>_index.json maps each member to the volume holding it, so a file can be
+    found without opening every volume.
+    """
+
+    def __init__(self, directory: Path, prefix: str, archive_format: str = 'tar',
+                 volume_size: int = 1024 * 1024 * 1024):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"archive_format must be one of {', '.join(ARCHIVE_FORMATS)}")
+        if volume_size < 1:
+            raise ValueError("volume_size must be at least 1 byte")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.archive_format = archive_format
+        self.volume_size = volume_size
+
+        self.members: Set[str] = set()
+        self.member_volumes: Dict[str, str] = {}
+        # Volumes whose members are all recorded in the index file
+        self.sealed_volumes: Set[str] = set()
+        self.volume_index = 0
+        self.volume_path: Optional[Path] = None
+        self.volume_members = 0
+        self.volume_bytes = 0
+        self._tar_file = None
+        self._zip_file: Optional[zipfile.ZipFile] = None
+
+        self._load_existing_volumes()
+
+    def _path_for(self, index: int) -> Path:
+        return self.directory / f"{self.prefix}_{index:04d}.{self.archive_format}"
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / f"{self.prefix}_index.json"
+
+    def _load_existing_volumes(self):
+        """Index members of volumes from previous runs so they are not downloaded again"""
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                self.member_volumes = saved.get('members', {})
+                self.sealed_volumes = set(saved.get('volumes', []))
+            except Exception as e:
+                print(f"Could not load archive index {self.index_path.name}: {e}")
+
+        index = 1
+        while self._path_for(index).exists():
+            path = self._path_for(index)
+            # Only volumes missing from the index (e.g. after a crash) have to be opened
+            if path.name not in self.sealed_volumes:
+                try:
+                    if self.archive_format == 'tar':
+                        with tarfile.open(path, 'r') as tar:
+                            names = tar.getnames()
+                    else:
+                        with zipfile.ZipFile(path, 'r') as zf:
+                            names = zf.namelist()
+                    for name in names:
+                        self.member_volumes[name] = path.name
+                    self.sealed_volumes.add(path.name)
+                except (tarfile.TarError, zipfile.BadZipFile, OSError) as e:
+                    print(f"Could not read archive volume {path.name}: {e}")
+            self.volume_index = index
+            index += 1
+
+        self.members.update(self.member_volumes)
+
+    def volume_for(self, name: str) -> Optional[str]:
+        """File name of the volume that holds a member"""
+        return self.member_volumes.get(name)
+
+    def _save_index(self):
+        partial = self.index_path.with_name(self.index_path.name + '.part')
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump({'volumes': sorted(self.sealed_volumes), 'members': self.member_volumes}, f, indent=2)
+        os.replace(partial, self.index_path)
+
+    def contains(self, name: str) -> bool:
+        return name in self.members
+
+    def _open_volume(self):
+        """Start a fresh volume; earlier volumes are never appended to"""
+        self.close()
+        self.volume_index += 1
+        self.volume_path = self._path_for(self.volume_index)
+        self.volume_members = 0
+        self.volume_bytes = 0
+        if self.archive_format == 'tar':
+            self._tar_file = open(self.volume_path, 'wb')
+        else:
+            self._zip_file = zipfile.ZipFile(self.volume_path, 'w', compression=zipfile.ZIP_STORED,
+                                             allowZip64=True)
+        print(f"📦 Writing archive volume {self.volume_path.name}")
+
+    @staticmethod
+    def _tar_info(name: str, size: int) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        return info
+
+    def _member_bytes(self, name: str, size: int) -> int:
+        """Bytes a member adds to a volume, including headers and padding"""
+        if self.archive_format == 'tar':
+            # Long names add GNU longname blocks to the header
+            header = len(self._tar_info(name, size).tobuf(tarfile.GNU_FORMAT))
+            return header + -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        # Local header and central directory entry, each with name and a zip64 extra field
+        name_length = len(name.encode('utf-8'))
+        return (30 + name_length + 20) + size + (46 + name_length + 28)
+
+    def _ensure_room(self, name: str, size: int) -> int:
+        """Roll over to a new volume if the member and the volume's end records wouldn't fit"""
+        member_bytes = self._member_bytes(name, size)
+        end_size = TAR_END_SIZE if self.archive_format == 'tar' else ZIP_END_SIZE
+        is_open = self._tar_file is not None or self._zip_file is not None
+        if not is_open or (self.volume_members > 0 and
+                           self.volume_bytes + member_bytes + end_size > self.volume_size):
+            self._open_volume()
+        return member_bytes
+
+    async def add_stream(self, name: str, chunks: AsyncIterator[bytes], size: Optional[int] = None) -> str:
+        """Stream a member into the current volume, rolling over when it would exceed volume_size"""
+        if self.archive_format == 'tar' and size is not None:
+            member_bytes = self._ensure_room(name, size)
+            await self._stream_tar_member(name, chunks, size)
+        else:
+            # Size is needed up front for the tar header, and a zip entry can't be
+            # rolled back once written, so buffer the member before adding it
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+                async for chunk in chunks:
+                    spool.write(chunk)
+                size = spool.tell()
+                spool.seek(0)
+                member_bytes = self._ensure_room(name, size)
+                if self.archive_format == 'tar':
+                    await self._stream_tar_member(name, _iter_file(spool), size)
+                else:
+                    self._write_zip_member(name, spool)
+
+        self.members.add(name)
+        self.member_volumes[name] = self.volume_path.name
+        self.volume_members += 1
+        self.volume_bytes += member_bytes
+        return f"{self.volume_path.name}:{name}"
+
+    async def _stream_tar_member(self, name: str, chunks: AsyncIterator[bytes], size: int):
+        info = self._tar_info(name, size)
+
+        f = self._tar_file
+        start = f.tell()
+        try:
+            f.write(info.tobuf(tarfile.GNU_FORMAT))
+            written = 0
+            async for chunk in chunks:
+                written += len(chunk)
+                if written > size:
+                    raise IOError(f"received more than the {size} bytes announced for {name}")
+                f.write(chunk)
+            if written != size:
+                raise IOError(f"received {written} of {size} bytes for {name}")
+            remainder = size % tarfile.BLOCKSIZE
+            if remainder:
+                f.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        except BaseException:
+            # Drop the partial member so the volume stays valid
+            f.seek(start)
+            f.truncate()
+            raise
+
+    def _write_zip_member(self, name: str, source: io.IOBase):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        with self._zip_file.open(info, 'w', force_zip64=True) as dest:
+            while True:
+                block = source.read(1024 * 1024)
+                if not block:
+                    break
+                dest.write(block)
+
+    def close(self):
+        """Finish the current volume (tar end-of-archive blocks / zip central directory) and save the index"""
+        if self._tar_file is None and self._zip_file is None:
+            return
+        if self._tar_file is not None:
+            self._tar_file.write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+            self._tar_file.close()
+            self._tar_file = None
+        if self._zip_file is not None:
+            self._zip_file.close()
+            self._zip_file = None
+        self.sealed_volumes.add(self.volume_path.name)
+        self._save_index()
+
+
+async def _iter_file(f, chunk_size: int = 1024 * 1024):
+    while True:
+        block = f.read(chunk_size)
+        if not block:
+            break
+        yield block
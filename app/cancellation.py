@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+OnlyFans Downloader - Cancellation
+Cooperative stop flag shared by the scrape loop, download engine and writers
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import suppress
+
+
+# How often long waits re-check the token; bounds how long a stop request takes to land
+POLL_INTERVAL = 0.1
+
+
+class Cancelled(Exception):
+    """Raised when a stop was requested through a CancellationToken"""
+
+
+class CancellationToken:
+    """Thread-safe stop flag; can be set from a signal handler or another thread (e.g. the web UI)"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def reset(self):
+        self._event.clear()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    async def sleep(self, seconds: float):
+        """asyncio.sleep that returns early with Cancelled once a stop is requested"""
+        deadline = time.monotonic() + seconds
+        while True:
+            self.raise_if_cancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, POLL_INTERVAL))
+
+    async def run(self, coro):
+        """Await coro, cancelling it if a stop is requested before it finishes.
+
+        The coroutine sees a CancelledError at its current await, so its own
+        cleanup (removing partial files, aborting uploads) runs before Cancelled is raised here.
+        """
+        self.raise_if_cancelled()
+        task = asyncio.ensure_future(coro)
+        while not task.done():
+            await asyncio.wait({task}, timeout=POLL_INTERVAL)
+            if self.cancelled and not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+                raise Cancelled()
+        return task.result()
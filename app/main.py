@@ -5,20 +5,86 @@ Automates browser login, scrapes user profiles, and downloads all media
 """
 
 import asyncio
+import hashlib
 import json
 import os
+import re
+import signal
 import sys
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext
 import aiohttp
-import aiofiles
+
+from archive import ARCHIVE_FORMATS, ArchiveWriter
+from cancellation import Cancelled, CancellationToken
+from recompress import RECOMPRESS_FORMATS, ImageRecompressor
+from search_index import INDEX_FILENAME, PostIndex
+from storage import LocalStorage, S3Storage, StorageBackend
+
+
+QUALITY_PREFERENCES = ('highest', 'lowest')
+
+# post: media/<user>/post_<id>/   flat: media/<user>/
+# hashed: media/<user>/<ab>/      monthly: media/<user>/<YYYY-MM>/
+OUTPUT_LAYOUTS = ('post', 'flat', 'hashed', 'monthly')
+
+# Pseudo post holding network-captured videos that couldn't be matched to a post
+UNATTRIBUTED_POST_ID = 'unattributed'
+
+
+def select_video_variant(variants: List[Dict], max_quality: Optional[int] = None,
+                         prefer_quality: str = 'highest') -> Optional[Dict]:
+    """Pick a video source variant by height/bitrate under the given quality policy"""
+    if not variants:
+        return None
+    
+    def rank(variant):
+        return (variant.get('height') or 0, variant.get('bitrate') or 0)
+    
+    candidates = variants
+    if max_quality:
+        # Variants without a known height can't be checked against the cap (an "Auto"
+        # master is usually full resolution), so they are only used when no height is known
+        known = [v for v in variants if v.get('height')]
+        capped = [v for v in known if v['height'] <= max_quality]
+        if capped:
+            candidates = capped
+        elif known:
+            candidates = [min(known, key=rank)]
+    
+    if prefer_quality == 'lowest':
+        # An unknown height is usually an "Auto"/master source, not the smallest one
+        known = [v for v in candidates if v.get('height')]
+        return min(known or candidates, key=rank)
+    return max(candidates, key=rank)
 
 
 class OnlyFansDownloaderApp:
-    def __init__(self, output_dir: str = "downloads"):
+    def __init__(self, output_dir: str = "downloads", max_quality: Optional[int] = None,
+                 prefer_quality: str = 'highest', layout: str = 'post',
+                 archive_format: Optional[str] = None, archive_volume_size: int = 1024 * 1024 * 1024,
+                 storage: Optional[StorageBackend] = None, recompressor: Optional[ImageRecompressor] = None):
+        if prefer_quality not in QUALITY_PREFERENCES:
+            raise ValueError(f"prefer_quality must be one of {', '.join(QUALITY_PREFERENCES)}")
+        if layout not in OUTPUT_LAYOUTS:
+            raise ValueError(f"layout must be one of {', '.join(OUTPUT_LAYOUTS)}")
+        if archive_format and archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"archive_format must be one of {', '.join(ARCHIVE_FORMATS)}")
+        if archive_volume_size < 1:
+            raise ValueError("archive_volume_size must be at least 1 byte")
+        if archive_format and storage is not None and not isinstance(storage, LocalStorage):
+            raise ValueError("archive output is only supported with local storage")
+        if recompressor and (archive_format or (storage is not None and not isinstance(storage, LocalStorage))):
+            raise ValueError("image recompression is only supported for loose files on local storage")
+        self.max_quality = max_quality
+        self.prefer_quality = prefer_quality
+        self.layout = layout
+        self.archive_format = archive_format
+        self.archive_volume_size = archive_volume_size
+        self.archives: Dict[str, ArchiveWriter] = {}
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.session_dir = self.output_dir / "sessions"
@@ -27,11 +93,25 @@ class OnlyFansDownloaderApp:
         self.downloads_dir.mkdir(exist_ok=True)
         self.metadata_dir = self.output_dir / "metadata"
         self.metadata_dir.mkdir(exist_ok=True)
+        # Media and metadata go through the storage backend, keyed relative to output_dir
+        self.storage = storage or LocalStorage(self.output_dir)
+        self.recompressor = recompressor
+        self.recompressed: Dict[str, Dict[str, Dict]] = {}
+        # Metadata file written for each user in this run, so a later export can replace it
+        self.metadata_keys: Dict[str, str] = {}
+        # The search index is always local, even when metadata goes to object storage
+        self.search_index = PostIndex(self.metadata_dir / INDEX_FILENAME)
+        # Set from a signal handler or the web UI to stop scraping/downloading cleanly
+        self.cancel_token = CancellationToken()
         
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
         self.session_cookies = None
+        # Network-captured video URLs seen during a scrape, and the ones matched to a post
+        self.captured_video_urls: Dict[str, str] = {}
+        self.attributed_video_urls: set = set()
+        self.unattributed_video_urls: Dict[str, str] = {}
         
     async def initialize_browser(self, headless: bool = False):
         """Initialize Playwright browser"""
@@ -39,7 +119,9 @@ class OnlyFansDownloaderApp:
         playwright = await async_playwright().start()
         self.browser = await playwright.chromium.launch(
             headless=headless,
-            args=['--disable-blink-features=AutomationControlled']
+            args=['--disable-blink-features=AutomationControlled'],
+            # Ctrl+C is a graceful stop (see main); Playwright must not close the browser on it
+            handle_sigint=False
         )
         
         # Create context with realistic settings
@@ -141,58 +223,71 @@ class OnlyFansDownloaderApp:
         
         return self.page.url
     
-    async def scrape_user_posts(self, username: str, max_posts: Optional[int] = None) -> List[Dict]:
-        """Scrape all posts from a user's profile"""
+    async def scrape_user_posts(self, username: str, max_posts: Optional[int] = None,
+                                known_posts: Optional[List[Dict]] = None) -> List[Dict]:
+        """Scrape all posts from a user's profile, continuing from known_posts of an interrupted run"""
         print(f"Scraping posts from {username}...")
         
-        profile_url = await self.get_user_profile_url(username)
-        posts = []
+        profile_url = await self.cancel_token.run(self.get_user_profile_url(username))
+        if known_posts is None:
+            self.captured_video_urls = {}
+            self.attributed_video_urls = set()
+            self.unattributed_video_urls = {}
+        posts = list(known_posts or [])
         page_num = 0
         
-        while True:
-            print(f"📄 Scraping page {page_num + 1}...")
-            
-            # Scroll to load more posts
-            await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            await asyncio.sleep(2)
-            
-            # Extract posts from current page
-            page_posts = await self.extract_posts_from_page()
-            
-            if not page_posts:
-                print("No posts found on this page")
-                break
-            
-            # Add new posts
-            for post in page_posts:
-                if post not in posts:
-                    posts.append(post)
-            
-            print(f"Found {len(posts)} total posts so far")
-            
-            # Check if we've reached the limit
-            if max_posts and len(posts) >= max_posts:
-                posts = posts[:max_posts]
-                break
-            
-            # Try to load more posts
-            load_more = self.page.locator("text=Load more, text=Show more").first
-            if await load_more.count() > 0:
-                await load_more.click()
-                await asyncio.sleep(3)
-            else:
-                # Check if we can scroll more
-                old_height = await self.page.evaluate("document.body.scrollHeight")
+        try:
+            while True:
+                self.cancel_token.raise_if_cancelled()
+                print(f"📄 Scraping page {page_num + 1}...")
+                
+                # Scroll to load more posts
                 await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(2)
-                new_height = await self.page.evaluate("document.body.scrollHeight")
+                await self.cancel_token.sleep(2)
+                
+                # Extract posts from current page
+                page_posts = await self.cancel_token.run(self.extract_posts_from_page())
                 
-                if old_height == new_height:
-                    print("Reached end of posts")
+                if not page_posts:
+                    print("No posts found on this page")
                     break
-            
-            page_num += 1
+                
+                # Add new posts
+                for post in page_posts:
+                    if post not in posts:
+                        posts.append(post)
+                
+                print(f"Found {len(posts)} total posts so far")
+                
+                # Check if we've reached the limit
+                if max_posts and len(posts) >= max_posts:
+                    posts = posts[:max_posts]
+                    break
+                
+                # Try to load more posts
+                load_more = self.page.locator("text=Load more, text=Show more").first
+                if await load_more.count() > 0:
+                    await self.cancel_token.run(load_more.click())
+                    await self.cancel_token.sleep(3)
+                else:
+                    # Check if we can scroll more
+                    old_height = await self.page.evaluate("document.body.scrollHeight")
+                    await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                    await self.cancel_token.sleep(2)
+                    new_height = await self.page.evaluate("document.body.scrollHeight")
+                    
+                    if old_height == new_height:
+                        print("Reached end of posts")
+                        break
+                
+                page_num += 1
+        except Cancelled:
+            print(f"Scraping stopped after {len(posts)} posts")
+            self.update_unattributed_videos()
+            self.save_checkpoint(username, posts, scrape_complete=False)
+            raise
         
+        self.update_unattributed_videos()
         print(f"Scraped {len(posts)} posts from {username}")
         return posts
     
@@ -207,7 +302,32 @@ class OnlyFansDownloaderApp:
         posts_data = await self.page.evaluate("""
             () => {
                 const posts = [];
-                const postElements = document.querySelectorAll('.b-post, [class*="post"]');
+                // Real post elements when the page has them; '[class*="post"]' also matches feed
+                // wrappers (b-posts, user-posts) and parts of a post, so it is only a fallback
+                const outermost = (selector) => Array.from(document.querySelectorAll(selector))
+                    .filter(el => !(el.parentElement && el.parentElement.closest(selector)));
+                let postElements = outermost('.b-post, [data-id]');
+                if (postElements.length === 0) {
+                    postElements = outermost('[class*="post"]');
+                }
+                
+                // Index network-captured video URLs by the numeric ids in their path
+                // so each URL is only attached to the post/media it belongs to
+                const networkIndex = new Map();
+                const capturedUrls = [];
+                if (window.networkVideoUrls) {
+                    window.networkVideoUrls.forEach((data, key) => {
+                        const url = (data && data.url) || key;
+                        if (!url || url.startsWith('blob:')) return;
+                        capturedUrls.push(url);
+                        const path = url.split('?')[0];
+                        (path.match(/\d{4,}/g) || []).forEach(id => {
+                            if (!networkIndex.has(id)) networkIndex.set(id, []);
+                            networkIndex.get(id).push(url);
+                        });
+                    });
+                }
+                const attributedUrls = new Set();
                 
                 postElements.forEach((postEl, index) => {
                     try {
@@ -236,6 +356,7 @@ class OnlyFansDownloaderApp:
                         const videos = postEl.querySelectorAll('video, .video-wrapper, .video-js');
                         videos.forEach(video => {
                             let videoUrl = null;
+                            let variants = [];
                             
                             // Try to get from video element
                             if (video.tagName === 'VIDEO') {
@@ -251,6 +372,25 @@ class OnlyFansDownloaderApp:
                                         if (player && player.httpSourceSelector) {
                                             const sources = player.httpSourceSelector.sources;
                                             if (sources && sources.length > 0) {
+                                                // Record every variant; the downloader picks one by quality policy
+                                                variants = Array.from(sources)
+                                                    .filter(source => source && source.src && !source.src.startsWith('blob:'))
+                                                    .map(source => {
+                                                        const label = source.label || source.res || '';
+                                                        // "720p", "1080p60" or "1280x720"; anything else (Auto, 4K) stays unknown
+                                                        const text = String(label);
+                                                        const pMatch = text.match(/(\d{3,4})p/i);
+                                                        const sizeMatch = text.match(/(\d{3,4})\s*x\s*(\d{3,4})/i);
+                                                        const labelHeight = pMatch ? parseInt(pMatch[1], 10)
+                                                            : sizeMatch ? parseInt(sizeMatch[2], 10) : NaN;
+                                                        return {
+                                                            url: source.src,
+                                                            label: String(label),
+                                                            width: source.width || null,
+                                                            height: source.height || (isNaN(labelHeight) ? null : labelHeight),
+                                                            bitrate: source.bitrate || source.bandwidth || null
+                                                        };
+                                                    });
                                                 videoUrl = sources[0].src;
                                             }
                                         }
@@ -262,22 +402,41 @@ class OnlyFansDownloaderApp:
                             }
                             
                             if (videoUrl && !videoUrl.startsWith('blob:')) {
-                                post.media.push({
+                                const entry = {
                                     type: 'video',
                                     url: videoUrl
-                                });
+                                };
+                                if (variants.length > 0) {
+                                    entry.variants = variants;
+                                }
+                                post.media.push(entry);
                             }
                         });
                         
-                        // Extract video URLs from network requests (stored in extension)
-                        if (window.networkVideoUrls) {
-                            window.networkVideoUrls.forEach((data, url) => {
-                                if (url && !url.startsWith('blob:')) {
+                        // Attach network-captured video URLs matching this post or its media ids
+                        if (networkIndex.size > 0) {
+                            const ids = new Set();
+                            const postId = postEl.getAttribute('data-id');
+                            if (postId) ids.add(postId);
+                            postEl.querySelectorAll('[data-id], [data-media-id]').forEach(el => {
+                                // Ids of a nested post belong to that post, not to this element
+                                const owner = el.closest('.b-post');
+                                if (owner && owner !== postEl && postEl.contains(owner)) return;
+                                const mediaId = el.getAttribute('data-media-id') || el.getAttribute('data-id');
+                                if (mediaId) ids.add(mediaId);
+                            });
+                            const known = new Set(post.media.map(m => m.url.split('?')[0]));
+                            ids.forEach(id => {
+                                (networkIndex.get(id) || []).forEach(url => {
+                                    attributedUrls.add(url);
+                                    const cleanUrl = url.split('?')[0];
+                                    if (known.has(cleanUrl)) return;
+                                    known.add(cleanUrl);
                                     post.media.push({
                                         type: 'video',
                                         url: url
                                     });
-                                }
+                                });
                             });
                         }
                         
@@ -289,90 +448,399 @@ class OnlyFansDownloaderApp:
                     }
                 });
                 
-                return posts;
+                return { posts, captured: capturedUrls, attributed: Array.from(attributedUrls) };
             }
         """)
         
-        return posts_data
+        # A URL may be captured before its post renders, so attribution is settled over the
+        # whole scrape (see update_unattributed_videos), not per batch
+        for url in posts_data.get('captured', []):
+            self.captured_video_urls.setdefault(url.split('?')[0], url)
+        for url in posts_data.get('attributed', []):
+            self.attributed_video_urls.add(url.split('?')[0])
+        
+        return posts_data.get('posts', [])
+    
+    def update_unattributed_videos(self):
+        """Captured video URLs that no scraped post claimed; these are downloaded once, separately"""
+        self.unattributed_video_urls = {
+            clean_url: url for clean_url, url in self.captured_video_urls.items()
+            if clean_url not in self.attributed_video_urls
+        }
+    
+    def resolve_media(self, post_id: str, idx: int, media: Dict) -> Optional[Tuple[str, str]]:
+        """Return (download url, filename) for a media entry, or None if it can't be downloaded"""
+        url = media.get('url')
+        # HLS playlists can't be downloaded yet, so don't let one win over an MP4 variant
+        variants = [v for v in media.get('variants', []) if '.m3u8' not in (v.get('url') or '')]
+        variant = select_video_variant(variants, self.max_quality, self.prefer_quality)
+        if variant:
+            url = variant['url']
+        if not url:
+            return None
+        
+        # Clean URL
+        url = url.split('?')[0]  # Remove query params
+        
+        # Determine file extension
+        if media.get('type') == 'video':
+            ext = '.mp4'
+            if '.m3u8' in url:
+                return None
+        else:
+            ext = '.jpg'
+            if '.png' in url.lower():
+                ext = '.png'
+            elif '.gif' in url.lower():
+                ext = '.gif'
+        
+        if post_id == UNATTRIBUTED_POST_ID:
+            # Not tied to a post or a stable position, so name the file after its URL
+            return url, f"video_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}{ext}"
+        return url, f"{post_id}_{idx+1}{ext}"
+    
+    def media_relpath(self, post: Dict, username: str, filename: str) -> PurePosixPath:
+        """Path of a media file relative to the media directory, according to the output layout"""
+        post_id = str(post.get('id', 'unknown'))
+        base = PurePosixPath(username)
+        
+        if self.layout == 'flat':
+            return base / filename
+        if self.layout == 'hashed':
+            shard = hashlib.sha1(post_id.encode('utf-8')).hexdigest()[:2]
+            return base / shard / filename
+        if self.layout == 'monthly':
+            match = re.match(r'(\d{4})-(\d{2})', post.get('date') or '')
+            month = f"{match.group(1)}-{match.group(2)}" if match else 'undated'
+            return base / month / filename
+        return base / f"post_{post_id}" / filename
+    
+    def get_archive(self, username: str) -> ArchiveWriter:
+        """Archive writer for a user's rolling volumes, opened on first use"""
+        if username not in self.archives:
+            self.archives[username] = ArchiveWriter(
+                self.downloads_dir / username,
+                prefix=username,
+                archive_format=self.archive_format,
+                volume_size=self.archive_volume_size
+            )
+        return self.archives[username]
+    
+    def close_archives(self):
+        """Finish any open archive volumes"""
+        for archive in self.archives.values():
+            archive.close()
+        self.archives = {}
+    
+    def load_recompression_manifest(self, username: str) -> Dict[str, Dict]:
+        """Recompressed images of a user, keyed by the path they were downloaded under"""
+        if username not in self.recompressed:
+            manifest_file = self.metadata_dir / f"{username}_recompressed.json"
+            manifest = {}
+            if manifest_file.exists():
+                try:
+                    with open(manifest_file, 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                except Exception as e:
+                    print(f"Could not load recompression manifest: {e}")
+            self.recompressed[username] = manifest
+        return self.recompressed[username]
+    
+    async def finish_recompression(self, username: str) -> int:
+        """Wait for queued recompression jobs, record them in the manifest and return bytes saved"""
+        if not self.recompressor:
+            return 0
+        return await self.record_recompression(username, await self.recompressor.drain())
     
-    async def download_media(self, post: Dict, username: str):
-        """Download all media from a post"""
+    async def stop_recompression(self, username: str) -> int:
+        """On stop: drop jobs not yet handed to a worker, but record the ones that ran or will run"""
+        if not self.recompressor:
+            return 0
+        return await self.record_recompression(username, await self.recompressor.stop())
+    
+    async def record_recompression(self, username: str, results: List[Dict]) -> int:
+        """Add recompression results to the user's manifest and return bytes saved"""
+        manifest = self.load_recompression_manifest(username)
+        bytes_saved = 0
+        recompressed = 0
+        for result in results:
+            if result['status'] == 'error':
+                print(f"Could not recompress {result['relpath']}: {result.get('reason')}")
+            if result['status'] != 'recompressed':
+                continue
+            relpath = PurePosixPath(result['relpath'])
+            manifest[result['relpath']] = {
+                'path': str(relpath.with_suffix(Path(result['path']).suffix)),
+                'format': result['format'],
+                'original_sha256': result['original_sha256'],
+                'original_size': result['original_size'],
+                'size': result['size']
+            }
+            bytes_saved += result['original_size'] - result['size']
+            recompressed += 1
+        
+        if results:
+            await self.storage.write_bytes(
+                f"metadata/{username}_recompressed.json",
+                json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')
+            )
+            print(f"🗜️ Recompressed {recompressed}/{len(results)} images, saved {bytes_saved / (1024 * 1024):.1f} MB")
+        return bytes_saved
+    
+    async def download_media(self, post: Dict, username: str, failures: Optional[List[str]] = None):
+        """Download all media from a post; names of files that failed are appended to failures"""
         post_id = post.get('id', 'unknown')
-        post_dir = self.downloads_dir / username / f"post_{post_id}"
-        post_dir.mkdir(parents=True, exist_ok=True)
+        archive = self.get_archive(username) if self.archive_format else None
+        # Also read without --recompress: the originals of recompressed images are gone
+        recompressed = {} if archive else self.load_recompression_manifest(username)
         
         media_files = []
         
         for idx, media in enumerate(post.get('media', [])):
             try:
-                url = media.get('url')
-                if not url:
-                    continue
-                
-                # Clean URL
-                url = url.split('?')[0]  # Remove query params
-                
-                # Determine file extension
-                if media.get('type') == 'video':
-                    ext = '.mp4'
-                    if '.m3u8' in url:
+                resolved = self.resolve_media(post_id, idx, media)
+                if not resolved:
+                    urls = [media.get('url') or ''] + [v.get('url') or '' for v in media.get('variants', [])]
+                    if any('.m3u8' in url for url in urls):
                         print(f"HLS stream detected for post {post_id}, skipping (requires special handling)")
-                        continue
-                else:
-                    ext = '.jpg'
-                    if '.png' in url.lower():
-                        ext = '.png'
-                    elif '.gif' in url.lower():
-                        ext = '.gif'
-                
-                filename = f"{post_id}_{idx+1}{ext}"
-                filepath = post_dir / filename
+                    continue
+                url, filename = resolved
+                relpath = self.media_relpath(post, username, filename)
+                key = f"media/{relpath}"
                 
                 # Skip if already downloaded
-                if filepath.exists():
+                if str(relpath) in recompressed:
                     print(f"Skipping {filename} (already exists)")
-                    media_files.append(str(filepath))
+                    media_files.append(self.storage.describe(f"media/{recompressed[str(relpath)]['path']}"))
+                    continue
+                if archive.contains(str(relpath)) if archive else await self.storage.exists(key):
+                    print(f"Skipping {filename} (already exists)")
+                    if archive:
+                        media_files.append(f"{archive.volume_for(str(relpath))}:{relpath}")
+                    else:
+                        media_files.append(self.storage.describe(key))
                     continue
                 
                 print(f"Downloading {filename}...")
                 
                 # Download file
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url) as response:
-                        if response.status == 200:
-                            async with aiofiles.open(filepath, 'wb') as f:
-                                async for chunk in response.content.iter_chunked(8192):
-                                    await f.write(chunk)
-                            print(f"Downloaded {filename}")
-                            media_files.append(str(filepath))
-                        else:
-                            print(f"Failed to download {filename}: HTTP {response.status}")
+                async def transfer():
+                    async with aiohttp.ClientSession() as session:
+                        async with session.get(url) as response:
+                            if response.status == 200:
+                                if archive:
+                                    location = await archive.add_stream(
+                                        str(relpath),
+                                        response.content.iter_chunked(8192),
+                                        response.content_length
+                                    )
+                                    media_files.append(location)
+                                else:
+                                    await self.storage.write_stream(
+                                        key,
+                                        response.content.iter_chunked(8192),
+                                        response.content_length
+                                    )
+                                    media_files.append(self.storage.describe(key))
+                                    # Re-encode in the background while the next files download
+                                    filepath = self.downloads_dir / relpath
+                                    if self.recompressor and self.recompressor.accepts(filepath):
+                                        self.recompressor.submit(filepath, str(relpath))
+                                print(f"Downloaded {filename}")
+                            else:
+                                print(f"Failed to download {filename}: HTTP {response.status}")
+                                if failures is not None:
+                                    failures.append(filename)
+                
+                # A stop request aborts the transfer; the writers drop the partial file/upload
+                await self.cancel_token.run(transfer())
                 
                 # Rate limiting
-                await asyncio.sleep(0.5)
+                await self.cancel_token.sleep(0.5)
                 
+            except Cancelled:
+                print(f"Stopped while downloading media for post {post_id}")
+                raise
             except Exception as e:
                 print(f"Error downloading media: {e}")
+                if failures is not None:
+                    failures.append(media.get('url') or f"{post_id}_{idx+1}")
         
         return media_files
     
-    async def export_metadata(self, username: str, posts: List[Dict]):
-        """Export post metadata to JSON"""
-        metadata_file = self.metadata_dir / f"{username}_posts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    async def download_unattributed_media(self, username: str, failures: Optional[List[str]] = None):
+        """Download network-captured videos that could not be matched to a post"""
+        if not self.unattributed_video_urls:
+            return []
         
+        print(f"Downloading {len(self.unattributed_video_urls)} unattributed videos...")
+        bucket = {
+            'id': UNATTRIBUTED_POST_ID,
+            'media': [{'type': 'video', 'url': url} for url in self.unattributed_video_urls.values()]
+        }
+        return await self.download_media(bucket, username, failures)
+    
+    def with_media_paths(self, post: Dict, username: str) -> Dict:
+        """Copy of a post whose media entries carry the layout-relative path they are saved under"""
+        post_id = post.get('id', 'unknown')
+        recompressed = {} if self.archive_format else self.load_recompression_manifest(username)
+        media_list = []
+        for idx, media in enumerate(post.get('media', [])):
+            media = dict(media)
+            resolved = self.resolve_media(post_id, idx, media)
+            if resolved:
+                media['path'] = str(self.media_relpath(post, username, resolved[1]))
+                if media['path'] in recompressed:
+                    entry = recompressed[media['path']]
+                    media['path'] = entry['path']
+                    media['original_sha256'] = entry['original_sha256']
+            media_list.append(media)
+        return {**post, 'media': media_list}
+    
+    async def export_metadata(self, username: str, posts: List[Dict], replace: bool = False):
+        """Export post metadata to JSON; replace=True rewrites this run's earlier export for the user"""
+        # Checked before writing only: the write itself is atomic and finishes once started
+        self.cancel_token.raise_if_cancelled()
+        metadata_key = self.metadata_keys.get(username) if replace else None
+        if metadata_key is None:
+            metadata_key = f"metadata/{username}_posts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self.metadata_keys[username] = metadata_key
+        
+        unattributed = {
+            'id': UNATTRIBUTED_POST_ID,
+            'media': [{'type': 'video', 'url': url} for url in self.unattributed_video_urls.values()]
+        }
         export_data = {
             'username': username,
             'export_date': datetime.now().isoformat(),
+            'layout': self.layout,
+            'archive_format': self.archive_format,
+            # Where media paths are relative to: a local directory or an s3:// prefix
+            'media_root': self.storage.describe('media'),
+            # Member name -> volume map, relative to the media directory (see ArchiveWriter)
+            'archive_index': f"{username}/{username}_index.json" if self.archive_format else None,
             'total_posts': len(posts),
-            'posts': posts
+            'posts': [self.with_media_paths(post, username) for post in posts],
+            'unattributed_media': self.with_media_paths(unattributed, username)['media']
         }
         
-        async with aiofiles.open(metadata_file, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(export_data, indent=2, ensure_ascii=False))
+        await self.storage.write_bytes(
+            metadata_key,
+            json.dumps(export_data, indent=2, ensure_ascii=False).encode('utf-8')
+        )
         
+        metadata_file = self.storage.describe(metadata_key)
         print(f"💾 Metadata exported to {metadata_file}")
+        
+        try:
+            self.search_index.index_export(export_data)
+        except Exception as e:
+            print(f"Could not update search index: {e}")
+        
         return metadata_file
     
+    def checkpoint_file(self, username: str) -> Path:
+        return self.session_dir / f"{username}_checkpoint.json"
+    
+    def load_checkpoint(self, username: str) -> Dict:
+        """Progress saved by an interrupted run, or {} if there is none"""
+        checkpoint_file = self.checkpoint_file(username)
+        if not checkpoint_file.exists():
+            return {}
+        try:
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Could not load checkpoint: {e}")
+            return {}
+    
+    def save_checkpoint(self, username: str, posts: List[Dict], scrape_complete: bool,
+                        completed_posts: Optional[set] = None):
+        """Atomically record scraped posts and finished post ids so the next run can resume"""
+        checkpoint = {
+            'username': username,
+            'saved_at': datetime.now().isoformat(),
+            'scrape_complete': scrape_complete,
+            'posts': posts,
+            'captured_video_urls': self.captured_video_urls,
+            'attributed_video_urls': sorted(self.attributed_video_urls),
+            'unattributed_video_urls': self.unattributed_video_urls,
+            'completed_posts': sorted(completed_posts or [])
+        }
+        checkpoint_file = self.checkpoint_file(username)
+        partial = checkpoint_file.with_name(checkpoint_file.name + '.part')
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(partial, checkpoint_file)
+        print(f"💾 Checkpoint saved ({len(posts)} posts, {len(checkpoint['completed_posts'])} done)")
+    
+    def clear_checkpoint(self, username: str):
+        self.checkpoint_file(username).unlink(missing_ok=True)
+    
+    async def collect_posts(self, username: str, max_posts: Optional[int] = None) -> List[Dict]:
+        """Scrape a user's posts, reusing what an interrupted run already scraped"""
+        checkpoint = self.load_checkpoint(username)
+        if checkpoint:
+            self.captured_video_urls = checkpoint.get('captured_video_urls', {})
+            self.attributed_video_urls = set(checkpoint.get('attributed_video_urls', []))
+            self.unattributed_video_urls = checkpoint.get('unattributed_video_urls', {})
+        
+        if checkpoint.get('scrape_complete'):
+            posts = checkpoint['posts']
+            print(f"Resuming from checkpoint: {len(posts)} posts already scraped")
+            return posts[:max_posts] if max_posts else posts
+        
+        known_posts = checkpoint.get('posts') if checkpoint else None
+        if known_posts:
+            print(f"Resuming from checkpoint: continuing after {len(known_posts)} scraped posts")
+        posts = await self.scrape_user_posts(username, max_posts, known_posts=known_posts)
+        if posts:
+            self.save_checkpoint(username, posts, scrape_complete=True,
+                                 completed_posts=set(checkpoint.get('completed_posts', [])))
+        return posts
+    
+    async def download_posts(self, username: str, posts: List[Dict],
+                             on_progress: Optional[Callable[[int, int, int], None]] = None) -> int:
+        """Download media for every post not finished by a previous run; returns the number of files"""
+        checkpoint = self.load_checkpoint(username)
+        completed = set(checkpoint.get('completed_posts', []))
+        downloaded_files = 0
+        
+        try:
+            for idx, post in enumerate(posts, 1):
+                post_id = str(post.get('id', 'unknown'))
+                if post_id in completed:
+                    continue
+                print(f"\n📦 Processing post {idx}/{len(posts)}...")
+                failures = []
+                files = await self.download_media(post, username, failures)
+                downloaded_files += len(files)
+                # Posts with failed files stay pending so a resumed run retries them
+                if not failures:
+                    completed.add(post_id)
+                if on_progress:
+                    on_progress(idx, len(posts), downloaded_files)
+                await self.cancel_token.sleep(1)  # Rate limiting between posts
+            
+            if UNATTRIBUTED_POST_ID not in completed:
+                failures = []
+                downloaded_files += len(await self.download_unattributed_media(username, failures))
+                if not failures:
+                    completed.add(UNATTRIBUTED_POST_ID)
+        except BaseException:
+            # Stop request, Ctrl+C or crash: keep finished posts so the next run skips them
+            if self.recompressor:
+                try:
+                    await self.stop_recompression(username)
+                except Exception as e:
+                    print(f"Could not record recompression results: {e}")
+            self.save_checkpoint(username, posts, scrape_complete=True, completed_posts=completed)
+            raise
+        finally:
+            self.close_archives()
+        
+        return downloaded_files
+    
     async def download_user_content(self, username: str, max_posts: Optional[int] = None, download_media: bool = True):
         """Main method to download all content from a user"""
         print(f"\n{'='*60}")
@@ -380,7 +848,7 @@ class OnlyFansDownloaderApp:
         print(f"{'='*60}\n")
         
         # Scrape posts
-        posts = await self.scrape_user_posts(username, max_posts)
+        posts = await self.collect_posts(username, max_posts)
         
         if not posts:
             print(f"No posts found for {username}")
@@ -392,17 +860,24 @@ class OnlyFansDownloaderApp:
         # Download media
         if download_media:
             print(f"\nDownloading media for {len(posts)} posts...")
-            for idx, post in enumerate(posts, 1):
-                print(f"\n📦 Processing post {idx}/{len(posts)}...")
-                await self.download_media(post, username)
-                await asyncio.sleep(1)  # Rate limiting between posts
+            await self.download_posts(username, posts)
+            if self.recompressor:
+                await self.finish_recompression(username)
+                # Re-export so this run's metadata and search index point at the re-encoded
+                # files and carry the original hashes
+                await self.export_metadata(username, posts, replace=True)
         
+        self.clear_checkpoint(username)
         print(f"\nCompleted download for {username}")
-        print(f"Files saved to: {self.downloads_dir / username}")
-        print(f"📄 Metadata saved to: {self.metadata_dir}")
+        print(f"Files saved to: {self.storage.describe(f'media/{username}')}")
+        print(f"📄 Metadata saved to: {self.storage.describe('metadata')}")
     
     async def close(self):
         """Close browser and cleanup"""
+        self.close_archives()
+        if self.recompressor:
+            self.recompressor.shutdown()
+        await self.storage.close()
         if self.context:
             await self.context.close()
         if self.browser:
@@ -422,10 +897,51 @@ async def main():
     parser.add_argument('--headless', action='store_true', help='Run browser in headless mode')
     parser.add_argument('--no-download', action='store_true', help='Only scrape metadata, do not download media')
     parser.add_argument('--output-dir', default='downloads', help='Output directory for downloads')
+    parser.add_argument('--max-quality', type=int, help='Highest video resolution (height, e.g. 720) to download')
+    parser.add_argument('--prefer-quality', choices=QUALITY_PREFERENCES, default='highest',
+                        help='Which allowed video variant to download (default: highest)')
+    parser.add_argument('--layout', choices=OUTPUT_LAYOUTS, default='post',
+                        help='How media files are grouped into directories (default: post)')
+    parser.add_argument('--archive', choices=ARCHIVE_FORMATS,
+                        help='Stream media into rolling tar/zip volumes instead of loose files')
+    parser.add_argument('--archive-volume-size', type=int, default=1024,
+                        help='Maximum archive volume size in MB (default: 1024)')
+    parser.add_argument('--s3-bucket', help='Upload media and metadata to this S3-compatible bucket instead of local disk')
+    parser.add_argument('--s3-prefix', default='', help='Key prefix inside the S3 bucket')
+    parser.add_argument('--s3-endpoint-url', help='Endpoint for S3-compatible stores such as MinIO')
+    parser.add_argument('--recompress', choices=list(RECOMPRESS_FORMATS),
+                        help='Re-encode downloaded images to this format (keeps originals that would grow)')
+    parser.add_argument('--recompress-quality', type=int, default=90, help='Encoder quality for --recompress (default: 90)')
+    parser.add_argument('--lossless', action='store_true', help='Use lossless WebP/AVIF encoding for --recompress')
+    parser.add_argument('--recompress-workers', type=int, help='Worker processes for --recompress (default: CPU count)')
     
     args = parser.parse_args()
+    if args.archive_volume_size < 1:
+        parser.error('--archive-volume-size must be at least 1 (MB)')
+    
+    storage = None
+    if args.s3_bucket:
+        storage = S3Storage(args.s3_bucket, prefix=args.s3_prefix, endpoint_url=args.s3_endpoint_url)
     
-    app = OnlyFansDownloaderApp(output_dir=args.output_dir)
+    recompressor = None
+    if args.recompress:
+        recompressor = ImageRecompressor(
+            target_format=args.recompress,
+            quality=args.recompress_quality,
+            lossless=args.lossless,
+            workers=args.recompress_workers
+        )
+    
+    app = OnlyFansDownloaderApp(
+        output_dir=args.output_dir,
+        max_quality=args.max_quality,
+        prefer_quality=args.prefer_quality,
+        layout=args.layout,
+        archive_format=args.archive,
+        archive_volume_size=args.archive_volume_size * 1024 * 1024,
+        storage=storage,
+        recompressor=recompressor
+    )
     
     try:
         # Initialize browser
@@ -444,6 +960,13 @@ async def main():
             input("Press Enter after you've logged in...")
             await app.save_session()
         
+        # First Ctrl+C stops cleanly and saves a checkpoint, a second one aborts immediately
+        def request_stop(signum, frame):
+            print("\nStopping... (press Ctrl+C again to force quit)")
+            app.cancel_token.cancel()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGINT, request_stop)
+        
         # Download user content
         await app.download_user_content(
             username=args.username,
@@ -451,6 +974,8 @@ async def main():
             download_media=not args.no_download
         )
         
+    except Cancelled:
+        print("\nStopped. Progress saved; run the same command again to resume.")
     except KeyboardInterrupt:
         print("\nInterrupted by user")
     except Exception as e:
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+OnlyFans Downloader - Image Recompression
+Optional post-download stage that re-encodes images (e.g. lossless WebP, AVIF) in a process pool
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Pillow format name and file extension for each supported target
+RECOMPRESS_FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+
+RECOMPRESSIBLE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def recompress_image(source: str, target_format: str, quality: int, lossless: bool) -> Dict:
+    """Re-encode one image file in place; runs inside a worker process.
+
+    The new file replaces the original only if it is smaller.
+    """
+    from PIL import Image
+
+    if target_format == 'avif':
+        try:
+            import pillow_avif  # noqa: F401 - registers AVIF support on older Pillow
+        except ImportError:
+            pass
+
+    source_path = Path(source)
+    data = source_path.read_bytes()
+    result = {
+        'original_sha256': hashlib.sha256(data).hexdigest(),
+        'original_size': len(data),
+        'size': len(data),
+        'path': source,
+        'status': 'skipped',
+    }
+
+    pil_format, ext = RECOMPRESS_FORMATS[target_format]
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if getattr(img, 'is_animated', False):
+                result['reason'] = 'animated'
+                return result
+            # Keep orientation and colour profile; Pillow drops them unless passed to save()
+            metadata = {key: img.info[key] for key in ('exif', 'icc_profile') if img.info.get(key)}
+            if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            params = {'quality': quality, **metadata}
+            if lossless and pil_format in ('WEBP', 'AVIF'):
+                params['lossless'] = True
+            buffer = io.BytesIO()
+            img.save(buffer, format=pil_format, **params)
+    except Exception as e:
+        result['status'] = 'error'
+        result['reason'] = str(e)
+        return result
+
+    encoded = buffer.getvalue()
+    if len(encoded) >= len(data):
+        result['reason'] = 'would grow'
+        return result
+
+    target_path = source_path.with_suffix(ext)
+    partial = target_path.with_name(target_path.name + '.part')
+    partial.write_bytes(encoded)
+    os.replace(partial, target_path)
+    if target_path != source_path:
+        source_path.unlink()
+
+    result.update({
+        'status': 'recompressed',
+        'path': str(target_path),
+        'size': len(encoded),
+        'format': target_format,
+    })
+    return result
+
+
+class ImageRecompressor:
+    """Runs recompress_image in a process pool so encoding overlaps with ongoing downloads"""
+
+    def __init__(self, target_format: str = 'webp', quality: int = 90, lossless: bool = False,
+                 workers: Optional[int] = None):
+        if target_format not in RECOMPRESS_FORMATS:
+            raise ValueError(f"target_format must be one of {', '.join(RECOMPRESS_FORMATS)}")
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise ImportError("Image recompression requires Pillow: pip install Pillow")
+
+        self.target_format = target_format
+        self.quality = quality
+        self.lossless = lossless
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # (executor future, result task) per queued image
+        self.pending: List[Tuple[Future, asyncio.Future]] = []
+
+    @staticmethod
+    def accepts(path: Path) -> bool:
+        return path.suffix.lower() in RECOMPRESSIBLE_EXTENSIONS
+
+    def submit(self, path: Path, relpath: str):
+        """Queue a downloaded image; returns immediately"""
+        future = self.executor.submit(recompress_image, str(path), self.target_format, self.quality, self.lossless)
+        task = asyncio.ensure_future(self._tag(asyncio.wrap_future(future), relpath))
+        self.pending.append((future, task))
+
+    @staticmethod
+    async def _tag(future, relpath: str) -> Dict:
+        try:
+            result = await future
+        except Exception as e:
+            result = {'status': 'error', 'reason': str(e)}
+        result['relpath'] = relpath
+        return result
+
+    async def drain(self) -> List[Dict]:
+        """Wait for all queued images and return their results"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        return list(await asyncio.gather(*(task for _, task in pending)))
+
+    async def stop(self) -> List[Dict]:
+        """Cancel images no worker has picked up yet and wait for the rest.
+
+        Jobs already running (or already handed to the pool) will still replace files
+        on disk, so their results are returned for the manifest rather than dropped.
+        """
+        pending, self.pending = self.pending, []
+        remaining = []
+        for future, task in pending:
+            if future.cancel():
+                task.cancel()
+            else:
+                remaining.append(task)
+        if not remaining:
+            return []
+        return list(await asyncio.gather(*remaining))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+OnlyFans Downloader - Post Search Index
+SQLite FTS index over exported post metadata, with a small query CLI
+"""
+
+import json
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+INDEX_FILENAME = "posts_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    date TEXT,
+    text TEXT,
+    media_count INTEGER NOT NULL DEFAULT 0,
+    paths TEXT NOT NULL DEFAULT '[]',
+    media_root TEXT,
+    archive_index TEXT,
+    UNIQUE (username, post_id)
+);
+CREATE INDEX IF NOT EXISTS posts_username_date ON posts (username, date);
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5 (text, tokenize = 'unicode61 remove_diacritics 2');
+CREATE TABLE IF NOT EXISTS indexed_files (
+    name TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+# Columns added after the first release; created on older index files when opened for writing
+ADDED_COLUMNS = ('media_root', 'archive_index')
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into an FTS5 query matching all words (prefix match on the last one)"""
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def media_locations(media_root: Optional[str], archive_index: Optional[str], paths: List[str],
+                    archive_members: Dict[str, Dict]) -> List[str]:
+    """Where each media path of a post actually lives: a file, an S3 URL or a volume:member pair"""
+    if not media_root:
+        return list(paths)
+    if not archive_index:
+        return [f"{media_root}/{path}" for path in paths]
+
+    # Volumes are only known once downloaded, so look them up in the archive's own index
+    index_file = Path(media_root) / archive_index
+    if str(index_file) not in archive_members:
+        members = {}
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                members = json.load(f).get('members', {})
+        except (OSError, ValueError):
+            pass
+        archive_members[str(index_file)] = members
+    members = archive_members[str(index_file)]
+    return [
+        f"{index_file.parent / members[path]}:{path}" if path in members
+        else f"{path} (not in {index_file} yet)"
+        for path in paths
+    ]
+
+
+class PostIndex:
+    """Full-text index of post text, dates, media counts and media paths across all users"""
+
+    def __init__(self, db_path: Path, read_only: bool = False):
+        """read_only=True never creates or changes anything on disk; a missing index just has no posts"""
+        self.db_path = Path(db_path)
+        self.read_only = read_only
+        if read_only:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self.connect()) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(posts)")}
+            for column in ADDED_COLUMNS:
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE posts ADD COLUMN {column} TEXT")
+
+    def connect(self) -> sqlite3.Connection:
+        # A connection per call keeps the index usable from the web UI's worker threads
+        if self.read_only:
+            conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True)
+        else:
+            conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def index_export(self, export_data: Dict) -> int:
+        """Insert or update every post of one export_metadata() payload; returns the post count"""
+        username = export_data.get('username', '')
+        posts = export_data.get('posts', [])
+        media_root = export_data.get('media_root')
+        archive_index = export_data.get('archive_index')
+
+        with closing(self.connect()) as conn, conn:
+            for post in posts:
+                post_id = str(post.get('id', ''))
+                media = post.get('media', [])
+                paths = [m['path'] for m in media if m.get('path')]
+                conn.execute(
+                    """
+                    INSERT INTO posts (username, post_id, date, text, media_count, paths, media_root, archive_index)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (username, post_id) DO UPDATE SET
+                        date = excluded.date, text = excluded.text,
+                        media_count = excluded.media_count, paths = excluded.paths,
+                        media_root = excluded.media_root, archive_index = excluded.archive_index
+                    """,
+                    (username, post_id, post.get('date') or '', post.get('text') or '', len(media),
+                     json.dumps(paths), media_root, archive_index)
+                )
+                row = conn.execute(
+                    "SELECT id FROM posts WHERE username = ? AND post_id = ?", (username, post_id)
+                ).fetchone()
+                conn.execute("DELETE FROM posts_fts WHERE rowid = ?", (row['id'],))
+                conn.execute("INSERT INTO posts_fts (rowid, text) VALUES (?, ?)", (row['id'], post.get('text') or ''))
+
+        return len(posts)
+
+    def index_metadata_dir(self, metadata_dir: Path) -> int:
+        """Index <username>_posts_<ts>.json files that are new or changed since the last call"""
+        indexed = 0
+        for metadata_file in sorted(Path(metadata_dir).glob('*_posts_*.json')):
+            mtime = metadata_file.stat().st_mtime
+            with closing(self.connect()) as conn:
+                known = conn.execute(
+                    "SELECT mtime FROM indexed_files WHERE name = ?", (metadata_file.name,)
+                ).fetchone()
+            if known and known['mtime'] >= mtime:
+                continue
+
+            try:
+                with open(metadata_file, 'r', encoding='utf-8') as f:
+                    export_data = json.load(f)
+            except Exception as e:
+                print(f"Could not index {metadata_file.name}: {e}")
+                continue
+
+            indexed += self.index_export(export_data)
+            with closing(self.connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO indexed_files (name, mtime) VALUES (?, ?)",
+                    (metadata_file.name, mtime)
+                )
+        return indexed
+
+    def search(self, query: str = '', username: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """Find posts by caption text and/or date range, best text matches first"""
+        clauses = []
+        params: list = []
+        if query.strip():
+            clauses.append("posts_fts MATCH ?")
+            params.append(fts_query(query))
+        if username:
+            clauses.append("posts.username = ?")
+            params.append(username)
+        if since:
+            clauses.append("posts.date >= ?")
+            params.append(since)
+        if until:
+            # Dates are stored as full ISO datetimes; compare only as much as was given so
+            # a date-only bound includes the whole day
+            clauses.append("substr(posts.date, 1, length(?)) <= ?")
+            params.extend([until, until])
+
+        if query.strip():
+            sql = """
+                SELECT posts.*, snippet(posts_fts, 0, '[', ']', '…', 12) AS snippet
+                FROM posts_fts JOIN posts ON posts.id = posts_fts.rowid
+            """
+            order = "ORDER BY bm25(posts_fts), posts.date DESC"
+        else:
+            sql = "SELECT posts.*, NULL AS snippet FROM posts"
+            order = "ORDER BY posts.date DESC"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" {order} LIMIT ?"
+        params.append(limit)
+
+        if self.read_only and not self.db_path.exists():
+            return []
+        with closing(self.connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        archive_members: Dict[str, Dict] = {}
+        results = []
+        for row in rows:
+            # Read-only access to an index created before these columns existed
+            extra = {column: row[column] if column in row.keys() else None for column in ADDED_COLUMNS}
+            paths = json.loads(row['paths'])
+            results.append({
+                'username': row['username'],
+                'post_id': row['post_id'],
+                'date': row['date'],
+                'text': row['text'],
+                'snippet': row['snippet'],
+                'media_count': row['media_count'],
+                'paths': paths,
+                'locations': media_locations(extra['media_root'], extra['archive_index'], paths, archive_members)
+            })
+        return results
+
+
+def main():
+    """Query CLI"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='OnlyFans Downloader - Search scraped posts')
+    parser.add_argument('query', nargs='?', default='', help='Words to search for in post text')
+    parser.add_argument('--user', help='Only search posts from this username')
+    parser.add_argument('--since', help='Only posts dated on or after this (e.g. 2024-01-01)')
+    parser.add_argument('--until', help='Only posts dated on or before this')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum number of results')
+    parser.add_argument('--output-dir', default='downloads', help='Output directory used for downloads')
+    parser.add_argument('--reindex', action='store_true', help='Index new or changed metadata files before searching')
+
+    args = parser.parse_args()
+
+    metadata_dir = Path(args.output_dir) / "metadata"
+    index = PostIndex(metadata_dir / INDEX_FILENAME, read_only=not args.reindex)
+    if args.reindex:
+        print(f"Indexed {index.index_metadata_dir(metadata_dir)} posts")
+
+    results = index.search(args.query, username=args.user, since=args.since, until=args.until, limit=args.limit)
+    for result in results:
+        print(f"{result['username']}/{result['post_id']}  {result['date']}  ({result['media_count']} media)")
+        print(f"    {result['snippet'] or result['text'][:120]}")
+        for location in result['locations']:
+            print(f"    {location}")
+    print(f"{len(results)} result(s)")
+
+
+if __name__ == "__main__":
+    main()
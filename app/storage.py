@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+OnlyFans Downloader - Storage Backends
+Where downloaded media and metadata are written: local disk or an S3-compatible object store
+"""
+
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+
+
+# S3 requires every multipart part except the last to be at least 5 MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class StorageBackend(ABC):
+    """Interface for writing objects addressed by '/'-separated keys (e.g. 'media/user/post_1/1_1.jpg')"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def write_stream(self, key: str, chunks: AsyncIterator[bytes], size: Optional[int] = None):
+        """Write an object from an async iterator of byte chunks"""
+
+    async def write_bytes(self, key: str, data: bytes):
+        async def single():
+            yield data
+        await self.write_stream(key, single(), len(data))
+
+    @abstractmethod
+    def describe(self, key: str) -> str:
+        """Human-readable location of a key, used in logs and return values"""
+
+    async def close(self):
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Writes objects as files under a root directory"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, key: str) -> Path:
+        return self.root.joinpath(*key.split('/'))
+
+    async def exists(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    async def write_stream(self, key: str, chunks: AsyncIterator[bytes], size: Optional[int] = None):
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the target and rename, so an interrupted write never looks complete
+        partial = path.with_name(path.name + '.part')
+        try:
+            async with aiofiles.open(partial, 'wb') as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+            os.replace(partial, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+
+    def describe(self, key: str) -> str:
+        return str(self.path_for(key))
+
+
+class S3Storage(StorageBackend):
+    """Streams objects into an S3-compatible bucket (AWS, MinIO, ...) using multipart uploads.
+
+    Credentials and region come from the usual AWS environment variables / config files.
+    Requires the optional aiobotocore package unless an already created S3 client is passed in.
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None,
+                 region_name: Optional[str] = None, part_size: int = 8 * 1024 * 1024, client=None):
+        self._session = None
+        if client is None:
+            try:
+                from aiobotocore.session import get_session
+            except ImportError:
+                raise ImportError("S3 storage requires aiobotocore: pip install aiobotocore")
+            self._session = get_session()
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._client_context = None
+        self._client = client
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    async def client(self):
+        """S3 client, created on first use and reused for all requests"""
+        if self._client is None:
+            self._client_context = self._session.create_client(
+                's3', endpoint_url=self.endpoint_url, region_name=self.region_name
+            )
+            self._client = await self._client_context.__aenter__()
+        return self._client
+
+    async def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        client = await self.client()
+        try:
+            await client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    async def write_stream(self, key: str, chunks: AsyncIterator[bytes], size: Optional[int] = None):
+        client = await self.client()
+        object_key = self.object_key(key)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) < self.part_size:
+                    continue
+                if upload_id is None:
+                    response = await client.create_multipart_upload(Bucket=self.bucket, Key=object_key)
+                    upload_id = response['UploadId']
+                await self._upload_part(client, object_key, upload_id, parts, bytes(buffer))
+                buffer.clear()
+
+            if upload_id is None:
+                # Small object: one request, no multipart bookkeeping
+                await client.put_object(Bucket=self.bucket, Key=object_key, Body=bytes(buffer))
+                return
+
+            if buffer:
+                await self._upload_part(client, object_key, upload_id, parts, bytes(buffer))
+            await client.complete_multipart_upload(
+                Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            # Don't leave orphaned parts (which are billed) behind
+            if upload_id is not None:
+                try:
+                    await client.abort_multipart_upload(Bucket=self.bucket, Key=object_key, UploadId=upload_id)
+                except Exception as e:
+                    print(f"Could not abort multipart upload for {object_key}: {e}")
+            raise
+
+    async def _upload_part(self, client, object_key: str, upload_id: str, parts: list, body: bytes):
+        part_number = len(parts) + 1
+        response = await client.upload_part(
+            Bucket=self.bucket, Key=object_key, UploadId=upload_id,
+            PartNumber=part_number, Body=body
+        )
+        parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def describe(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self.object_key(key)}"
+
+    async def close(self):
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client_context = None
+            self._client = None
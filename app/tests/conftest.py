@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app modules are plain scripts importing each other by name (from main import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
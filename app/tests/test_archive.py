@@ -0,0 +1,105 @@
+"""
+Tests for the rolling tar/zip archive volumes: size cap, rollback of failed members and resume.
+"""
+
+import asyncio
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from archive import ArchiveWriter
+
+
+async def chunked(data, chunk_size=1024, fail_after=None):
+    for offset in range(0, len(data), chunk_size):
+        if fail_after is not None and offset >= fail_after:
+            raise IOError("connection reset")
+        yield data[offset:offset + chunk_size]
+
+
+def read_volume(path):
+    if path.suffix == '.tar':
+        with tarfile.open(path, 'r') as tar:
+            return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+    with zipfile.ZipFile(path, 'r') as zf:
+        assert zf.testzip() is None
+        return {name: zf.read(name) for name in zf.namelist()}
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+@pytest.mark.parametrize('known_size', [True, False])
+def test_volumes_stay_under_volume_size(tmp_path, archive_format, known_size):
+    volume_size = 12000
+    archive = ArchiveWriter(tmp_path, 'u', archive_format=archive_format, volume_size=volume_size)
+    files = {f"u/post_{i}/{i}_1.jpg": os.urandom(3000 + i) for i in range(8)}
+
+    async def run():
+        for name, data in files.items():
+            await archive.add_stream(name, chunked(data), len(data) if known_size else None)
+
+    asyncio.run(run())
+    archive.close()
+
+    volumes = sorted(tmp_path.glob(f"u_*.{archive_format}"))
+    assert len(volumes) > 1
+    stored = {}
+    for volume in volumes:
+        assert volume.stat().st_size <= volume_size
+        for name, data in read_volume(volume).items():
+            stored[name] = data
+            assert archive.volume_for(name) == volume.name
+    assert stored == files
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+def test_failed_member_is_dropped_and_volume_resumes(tmp_path, archive_format):
+    archive = ArchiveWriter(tmp_path, 'u', archive_format=archive_format)
+    first = os.urandom(5000)
+    broken = os.urandom(8000)
+
+    async def run():
+        await archive.add_stream('u/1_1.jpg', chunked(first), len(first))
+        with pytest.raises(IOError):
+            await archive.add_stream('u/2_1.mp4', chunked(broken, fail_after=4096), len(broken))
+
+    asyncio.run(run())
+    archive.close()
+
+    volume = tmp_path / f"u_0001.{archive_format}"
+    assert read_volume(volume) == {'u/1_1.jpg': first}
+    assert not archive.contains('u/2_1.mp4')
+
+    # A new writer picks the members up from the index and never appends to an old volume
+    reopened = ArchiveWriter(tmp_path, 'u', archive_format=archive_format)
+    assert reopened.contains('u/1_1.jpg')
+    assert reopened.volume_for('u/1_1.jpg') == volume.name
+
+    asyncio.run(reopened.add_stream('u/2_1.mp4', chunked(broken), len(broken)))
+    reopened.close()
+
+    assert read_volume(volume) == {'u/1_1.jpg': first}
+    assert read_volume(tmp_path / f"u_0002.{archive_format}") == {'u/2_1.mp4': broken}
+    with open(tmp_path / 'u_index.json', 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    assert index['members'] == {'u/1_1.jpg': volume.name, 'u/2_1.mp4': f"u_0002.{archive_format}"}
+
+
+def test_unindexed_volume_is_read_on_resume(tmp_path):
+    archive = ArchiveWriter(tmp_path, 'u')
+    data = os.urandom(2000)
+    asyncio.run(archive.add_stream('u/1_1.jpg', chunked(data), len(data)))
+    archive.close()
+    # As if the run crashed before the index was written
+    (tmp_path / 'u_index.json').unlink()
+
+    reopened = ArchiveWriter(tmp_path, 'u')
+    assert reopened.contains('u/1_1.jpg')
+    assert reopened.volume_for('u/1_1.jpg') == 'u_0001.tar'
+
+
+def test_volume_size_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        ArchiveWriter(tmp_path, 'u', volume_size=0)
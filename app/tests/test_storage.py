@@ -0,0 +1,162 @@
+"""
+Tests for the storage backends.
+
+S3Storage runs against an in-memory stand-in for an S3-compatible endpoint.
+To also run against a real MinIO server, start one and set S3_TEST_ENDPOINT_URL
+(and S3_TEST_BUCKET, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY), e.g.:
+
+    docker run -p 9000:9000 minio/minio server /data
+"""
+
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from storage import MIN_PART_SIZE, LocalStorage, S3Storage, StorageBackend
+
+
+class FakeS3Client:
+    """Minimal in-memory S3 API: enough of put/multipart/abort/head for S3Storage"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    async def put_object(self, Bucket, Key, Body):
+        self.calls.append('put_object')
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    async def create_multipart_upload(self, Bucket, Key):
+        self.calls.append('create_multipart_upload')
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append('upload_part')
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        parts = self.uploads.pop(UploadId)
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        self.objects[(Bucket, Key)] = b''.join(parts[n] for n in numbers)
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        self.uploads.pop(UploadId, None)
+
+
+async def chunked(data, chunk_size=64 * 1024, fail_after=None):
+    for offset in range(0, len(data), chunk_size):
+        if fail_after is not None and offset >= fail_after:
+            raise IOError("connection reset")
+        yield data[offset:offset + chunk_size]
+
+
+def test_storage_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+
+def test_s3_small_object_uses_single_put():
+    client = FakeS3Client()
+    storage = S3Storage('bucket', prefix='archive', client=client)
+    data = os.urandom(100 * 1024)
+
+    asyncio.run(storage.write_stream('media/u/1_1.jpg', chunked(data)))
+
+    assert client.calls == ['put_object']
+    assert client.objects[('bucket', 'archive/media/u/1_1.jpg')] == data
+
+
+def test_s3_large_object_uses_multipart_with_min_part_size():
+    client = FakeS3Client()
+    storage = S3Storage('bucket', part_size=1024, client=client)
+    assert storage.part_size == MIN_PART_SIZE
+
+    data = os.urandom(2 * MIN_PART_SIZE + 123)
+    asyncio.run(storage.write_stream('media/u/1_1.mp4', chunked(data)))
+
+    assert client.calls == [
+        'create_multipart_upload', 'upload_part', 'upload_part', 'upload_part', 'complete_multipart_upload'
+    ]
+    assert client.objects[('bucket', 'media/u/1_1.mp4')] == data
+    assert not client.uploads
+
+
+def test_s3_failed_stream_aborts_multipart_upload():
+    client = FakeS3Client()
+    storage = S3Storage('bucket', part_size=MIN_PART_SIZE, client=client)
+    data = os.urandom(3 * MIN_PART_SIZE)
+
+    with pytest.raises(IOError):
+        asyncio.run(storage.write_stream('media/u/1_1.mp4', chunked(data, fail_after=MIN_PART_SIZE + 1)))
+
+    assert client.calls[-1] == 'abort_multipart_upload'
+    assert not client.uploads
+    assert not client.objects
+
+
+def test_s3_cancelled_stream_aborts_multipart_upload():
+    client = FakeS3Client()
+    storage = S3Storage('bucket', part_size=MIN_PART_SIZE, client=client)
+
+    async def stalled():
+        yield os.urandom(MIN_PART_SIZE)
+        await asyncio.sleep(60)
+        yield b'never sent'
+
+    async def run():
+        task = asyncio.ensure_future(storage.write_stream('media/u/1_1.mp4', stalled()))
+        while 'upload_part' not in client.calls:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert client.calls[-1] == 'abort_multipart_upload'
+    assert not client.objects
+
+
+def test_local_storage_removes_partial_file_on_failure(tmp_path):
+    storage = LocalStorage(tmp_path)
+    data = os.urandom(256 * 1024)
+
+    with pytest.raises(IOError):
+        asyncio.run(storage.write_stream('media/u/1_1.jpg', chunked(data, fail_after=64 * 1024)))
+
+    assert not asyncio.run(storage.exists('media/u/1_1.jpg'))
+    assert list((tmp_path / 'media' / 'u').iterdir()) == []
+
+    asyncio.run(storage.write_bytes('media/u/1_1.jpg', data))
+    assert (tmp_path / 'media' / 'u' / '1_1.jpg').read_bytes() == data
+
+
+@pytest.mark.skipif(not os.environ.get('S3_TEST_ENDPOINT_URL'), reason='S3_TEST_ENDPOINT_URL not set')
+def test_s3_round_trip_against_endpoint():
+    pytest.importorskip('aiobotocore')
+    storage = S3Storage(
+        os.environ.get('S3_TEST_BUCKET', 'onlyfans-downloader-test'),
+        prefix=f"test-{uuid.uuid4().hex}",
+        endpoint_url=os.environ['S3_TEST_ENDPOINT_URL']
+    )
+    data = os.urandom(MIN_PART_SIZE + 1)
+
+    async def run():
+        try:
+            await storage.write_stream('media/u/big.mp4', chunked(data))
+            await storage.write_bytes('metadata/u_posts.json', b'{}')
+            assert await storage.exists('media/u/big.mp4')
+            assert await storage.exists('metadata/u_posts.json')
+            assert not await storage.exists('media/u/missing.mp4')
+        finally:
+            await storage.close()
+
+    asyncio.run(run())
@@ -13,7 +13,9 @@ from flask import Flask, render_template, request, jsonify, send_from_directory
 from flask_socketio import SocketIO, emit
 import webbrowser
 
+from cancellation import Cancelled
 from main import OnlyFansDownloaderApp
+from search_index import INDEX_FILENAME, PostIndex
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'onlyfans-downloader-secret-key'
@@ -134,11 +136,17 @@ def download():
     if downloader_app is None:
         return jsonify({'success': False, 'error': 'Please login first'}), 400
     
+    # Jobs share the app's token, archives and checkpoint, so only one may run at a time;
+    # a stopped job counts as running until its thread has finished cleaning up
+    if download_status['is_running']:
+        return jsonify({'success': False, 'error': 'A download is still running'}), 409
+    download_status['is_running'] = True
+    
     def download_thread():
         global downloader_app
         try:
-            download_status['is_running'] = True
             download_status['current_user'] = username
+            downloader_app.cancel_token.reset()
             log_message(f'Starting download for {username}...', 'info')
             
             # Run async download
@@ -148,7 +156,7 @@ def download():
             # Custom download function with progress updates
             async def download_with_progress():
                 update_progress('Scraping posts...', 0, 0, 0)
-                posts = await downloader_app.scrape_user_posts(username, max_posts)
+                posts = await downloader_app.collect_posts(username, max_posts)
                 
                 if not posts:
                     log_message('No posts found', 'warning')
@@ -162,20 +170,23 @@ def download():
                 
                 if download_media:
                     update_progress('Downloading media...', 0, len(posts), 0)
-                    downloaded_files = 0
                     
-                    for idx, post in enumerate(posts, 1):
-                        update_progress(f'Downloading post {idx}/{len(posts)}...', idx, len(posts), downloaded_files)
-                        log_message(f'Processing post {idx}/{len(posts)}...', 'info')
-                        
-                        files = await downloader_app.download_media(post, username)
-                        downloaded_files += len(files)
-                        update_progress(f'Downloaded {downloaded_files} files', idx, len(posts), downloaded_files)
+                    def on_progress(idx, total, files):
+                        log_message(f'Processed post {idx}/{total}', 'info')
+                        update_progress(f'Downloaded {files} files', idx, total, files)
+                    
+                    downloaded_files = await downloader_app.download_posts(username, posts, on_progress)
+                    if downloader_app.recompressor:
+                        bytes_saved = await downloader_app.finish_recompression(username)
+                        await downloader_app.export_metadata(username, posts, replace=True)
+                        if bytes_saved:
+                            log_message(f'Recompression saved {bytes_saved / (1024 * 1024):.1f} MB', 'success')
                     
                     log_message(f'Downloaded {downloaded_files} files from {len(posts)} posts', 'success')
                 else:
                     log_message(f'Metadata only mode: {len(posts)} posts scraped', 'success')
                 
+                downloader_app.clear_checkpoint(username)
                 download_status['is_running'] = False
                 socketio.emit('download_complete', {
                     'success': True,
@@ -184,10 +195,17 @@ def download():
             
             loop.run_until_complete(download_with_progress())
             
+        except Cancelled:
+            log_message('Download stopped, progress saved. Start it again to resume.', 'warning')
+            download_status['is_running'] = False
+            update_progress('Stopped', 0, 0, 0)
+            socketio.emit('download_complete', {'success': False, 'message': 'Stopped'})
         except Exception as e:
             log_message(f'Download error: {str(e)}', 'error')
             download_status['is_running'] = False
             socketio.emit('download_complete', {'success': False, 'error': str(e)})
+        finally:
+            download_status['is_running'] = False
     
     thread = threading.Thread(target=download_thread, daemon=True)
     thread.start()
@@ -198,10 +216,36 @@ def download():
 def stop():
     """Stop current operation"""
     global downloader_app
-    download_status['is_running'] = False
+    if downloader_app is not None:
+        downloader_app.cancel_token.cancel()
+    # is_running stays set until the job's thread exits, so a new job can't reset the token early
     log_message('Stop requested', 'warning')
     return jsonify({'success': True, 'message': 'Stop requested'})
 
+@app.route('/api/search', methods=['GET'])
+def search():
+    """Search indexed posts by caption text, user and date range"""
+    if downloader_app is not None:
+        index = downloader_app.search_index
+    else:
+        # Don't create directories as a side effect of a search before anything was downloaded
+        index = PostIndex(Path('downloads') / 'metadata' / INDEX_FILENAME, read_only=True)
+    
+    try:
+        # SQLite treats a negative LIMIT as unlimited, so clamp on both ends
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be a number'}), 400
+    
+    results = index.search(
+        request.args.get('q', ''),
+        username=request.args.get('user') or None,
+        since=request.args.get('since') or None,
+        until=request.args.get('until') or None,
+        limit=limit
+    )
+    return jsonify({'success': True, 'results': results})
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
     """Get recent logs"""